@@ -3,5 +3,18 @@
 DEFAULT_DB_FILENAME = "keystrokes.db"
 APP_TITLE = "Keystroke Logger"
 WINDOW_GEOMETRY = "900x600"
+DEFAULT_KDF_ID = "argon2id"
 DEFAULT_KDF_ITERS = 200_000
+DEFAULT_ARGON2_ITERS = 3
+ARGON2_MEMORY_COST = 64 * 1024  # KiB
+ARGON2_LANES = 4
 DB_FILE_TYPES = [("SQLite DB", "*.db"), ("All files", "*.*")]
+FLUSH_INTERVAL_MS = 250
+FLUSH_MAX_PENDING = 100
+REPEAT_WINDOW_MS = 50
+FETCH_PAGE_SIZE = 500
+FETCH_LIMIT = 10_000
+VIEWER_BATCH_SIZE = 200
+WORKER_THREADS = 2
+DERIVE_POLL_MS = 50
+LOAD_POLL_MS = 30
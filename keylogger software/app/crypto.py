@@ -1,16 +1,72 @@
-"""Encryption and decryption of keystroke payloads using Fernet (AES) and PBKDF2."""
+"""Encryption and decryption of keystroke payloads using AES-GCM (or legacy Fernet) and PBKDF2 or Argon2id."""
 
 from __future__ import annotations
 
 import base64
+import binascii
 import json
+import os
+import struct
+import time
+import zlib
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Sequence, Union
 
-from cryptography.fernet import Fernet, InvalidToken
-from cryptography.hazmat.primitives import hashes
+from cryptography.exceptions import InvalidSignature, InvalidTag, UnsupportedAlgorithm
+from cryptography.hazmat.backends.openssl.backend import backend as _openssl_backend
+from cryptography.hazmat.primitives import hashes, hmac, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from .constants import ARGON2_LANES, ARGON2_MEMORY_COST
+
+try:
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    _json_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    def _json_dumps(obj: Any) -> bytes:
+        return _json_encode(obj).encode("utf-8")
+
+    _json_loads = json.loads
+
+KDF_PBKDF2_SHA256 = "pbkdf2-sha256"
+KDF_PBKDF2_SHA512 = "pbkdf2-sha512"
+KDF_ARGON2ID = "argon2id"
+
+_MIN_KDF_ITERS = {
+    KDF_PBKDF2_SHA256: 50_000,
+    KDF_PBKDF2_SHA512: 50_000,
+    KDF_ARGON2ID: 1,
+}
+
+# Ciphertext layout stored in logs.ciphertext, recorded per DB in meta.schema_version.
+SCHEMA_FERNET = 1
+SCHEMA_AESGCM = 2
+CURRENT_SCHEMA_VERSION = SCHEMA_AESGCM
+
+NONCE_SIZE = 12
+
+# Fernet token layout: version (1) | timestamp (8) | IV (16) | ciphertext | HMAC-SHA256 (32).
+_FERNET_VERSION = 0x80
+_FERNET_IV_START = 9
+_FERNET_CT_START = 25
+_FERNET_HMAC_SIZE = 32
+
+
+# Plaintext payload encodings, told apart by the first byte. Legacy rows are bare JSON ("{").
+_PAYLOAD_STRUCT = 0x01
+_PAYLOAD_ZLIB_JSON = 0x02
+_PAYLOAD_HEADER = struct.Struct("<BBiB")  # format, event kind, keycode, keysym length
+_ZLIB_MIN_SIZE = 64
+
+# The capturing widget is implied by the event kind in the packed format.
+EVENT_KINDS = {"logger_text": 1}
+_WIDGETS_BY_KIND = {kind: widget for widget, kind in EVENT_KINDS.items()}
+_STRUCT_FIELDS = {"char", "keysym", "keycode", "widget"}
+
 
 class CryptoError(Exception):
     """Raised when key derivation or encryption fails."""
@@ -20,47 +76,215 @@ class DecryptionError(CryptoError):
     """Raised when decryption fails (wrong passphrase or corrupted data)."""
 
 
+class MiniFernet:
+    """Fernet-compatible tokens from a raw 32-byte key, without Fernet's key base64 round-trip.
+
+    Reads and writes the same token format as cryptography.fernet.Fernet, which legacy
+    (schema version 1) databases store, reusing one HMAC context and AES key per instance.
+    """
+
+    def __init__(self, key: bytes) -> None:
+        if len(key) != 32:
+            raise CryptoError("Fernet key must be 32 bytes.")
+        self._hmac = hmac.HMAC(key[:16], hashes.SHA256())
+        self._aes = algorithms.AES(key[16:])
+
+    def encrypt(self, data: bytes) -> bytes:
+        iv = os.urandom(16)
+        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        padded = padder.update(data) + padder.finalize()
+        encryptor = Cipher(self._aes, modes.CBC(iv)).encryptor()
+        ciphertext = encryptor.update(padded) + encryptor.finalize()
+
+        body = struct.pack(">BQ", _FERNET_VERSION, int(time.time())) + iv + ciphertext
+        mac = self._hmac.copy()
+        mac.update(body)
+        return base64.urlsafe_b64encode(body + mac.finalize())
+
+    def decrypt(self, token: bytes) -> bytes:
+        """Verify and decrypt one token; raises DecryptionError on failure."""
+        try:
+            data = base64.urlsafe_b64decode(token)
+        except (TypeError, binascii.Error) as e:
+            raise DecryptionError("Wrong passphrase or corrupted data.") from e
+        if len(data) < _FERNET_CT_START + _FERNET_HMAC_SIZE or data[0] != _FERNET_VERSION:
+            raise DecryptionError("Wrong passphrase or corrupted data.")
+
+        mac = self._hmac.copy()
+        mac.update(data[:-_FERNET_HMAC_SIZE])
+        try:
+            mac.verify(data[-_FERNET_HMAC_SIZE:])
+        except InvalidSignature as e:
+            raise DecryptionError("Wrong passphrase or corrupted data.") from e
+
+        iv = data[_FERNET_IV_START:_FERNET_CT_START]
+        decryptor = Cipher(self._aes, modes.CBC(iv)).decryptor()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        try:
+            padded = decryptor.update(data[_FERNET_CT_START:-_FERNET_HMAC_SIZE])
+            padded += decryptor.finalize()
+            return unpadder.update(padded) + unpadder.finalize()
+        except ValueError as e:
+            raise DecryptionError("Wrong passphrase or corrupted data.") from e
+
+    def decrypt_many(self, tokens: Sequence[bytes]) -> list[bytes]:
+        return [self.decrypt(token) for token in tokens]
+
+
+PayloadCipher = Union[AESGCM, MiniFernet]
+
+
 @dataclass(frozen=True)
 class CryptoParams:
-    """Per-database salt and KDF iteration count for key derivation."""
+    """Per-database salt, KDF id, iteration count and ciphertext schema version."""
 
     salt: bytes
     kdf_iters: int
+    kdf_id: str = KDF_PBKDF2_SHA256
+    schema_version: int = SCHEMA_FERNET
+
 
+def argon2_supported() -> bool:
+    """Return whether cryptography's OpenSSL build provides Argon2id (OpenSSL 3.2+)."""
+    return _openssl_backend.argon2_supported()
+
+
+def _derive_argon2id(passphrase: str, salt: bytes, kdf_iters: int) -> bytes:
+    """Derive 32 raw key bytes with Argon2id; kdf_iters is the Argon2 time cost."""
+    try:
+        kdf = Argon2id(
+            salt=salt,
+            length=32,
+            iterations=kdf_iters,
+            lanes=ARGON2_LANES,
+            memory_cost=ARGON2_MEMORY_COST,
+        )
+    except UnsupportedAlgorithm as e:
+        raise CryptoError("Argon2id is not supported by this cryptography build.") from e
+    return kdf.derive(passphrase.encode("utf-8"))
 
-def derive_fernet_key(passphrase: str, salt: bytes, kdf_iters: int) -> bytes:
+
+def derive_key(
+    passphrase: str, salt: bytes, kdf_iters: int, kdf_id: str = KDF_PBKDF2_SHA256
+) -> bytes:
+    """Derive 32 raw key bytes from the passphrase with the DB's KDF."""
     if not passphrase:
         raise CryptoError("Passphrase is required.")
     if not salt:
         raise CryptoError("Salt is required.")
-    if kdf_iters < 50_000:
+    if kdf_id not in _MIN_KDF_ITERS:
+        raise CryptoError(f"Unknown KDF: {kdf_id}")
+    if kdf_iters < _MIN_KDF_ITERS[kdf_id]:
         raise CryptoError("kdf_iters too low.")
 
+    if kdf_id == KDF_ARGON2ID:
+        return _derive_argon2id(passphrase, salt, kdf_iters)
+
+    algorithm = hashes.SHA512() if kdf_id == KDF_PBKDF2_SHA512 else hashes.SHA256()
     kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
+        algorithm=algorithm,
         length=32,
         salt=salt,
         iterations=kdf_iters,
     )
-    key = kdf.derive(passphrase.encode("utf-8"))
-    return base64.urlsafe_b64encode(key)
+    return kdf.derive(passphrase.encode("utf-8"))
+
+
+def cipher_from_key(key: bytes, schema_version: int) -> PayloadCipher:
+    """Wrap raw key bytes in the payload cipher for the given schema version."""
+    if schema_version == SCHEMA_FERNET:
+        return MiniFernet(key)
+    if schema_version == SCHEMA_AESGCM:
+        return AESGCM(key)
+    raise CryptoError(f"Unsupported schema version: {schema_version}")
+
 
+def build_cipher(passphrase: str, params: CryptoParams) -> PayloadCipher:
+    """Build the payload cipher matching the DB's schema version."""
+    key = derive_key(passphrase, params.salt, params.kdf_iters, params.kdf_id)
+    return cipher_from_key(key, params.schema_version)
 
-def build_fernet(passphrase: str, salt: bytes, kdf_iters: int) -> Fernet:
-    """Build a Fernet instance from passphrase and stored crypto params."""
-    return Fernet(derive_fernet_key(passphrase=passphrase, salt=salt, kdf_iters=kdf_iters))
 
+def encode_payload(payload: dict[str, Any]) -> bytes:
+    """Pack a keystroke payload into bytes, using the fixed layout when it fits."""
+    kind = EVENT_KINDS.get(payload.get("widget", ""))
+    keycode = payload.get("keycode")
+    keysym = str(payload.get("keysym", "")).encode("utf-8")
+    if (
+        kind is not None
+        and set(payload) == _STRUCT_FIELDS
+        and isinstance(keycode, int)
+        and -(2**31) <= keycode < 2**31
+        and len(keysym) < 256
+    ):
+        header = _PAYLOAD_HEADER.pack(_PAYLOAD_STRUCT, kind, keycode, len(keysym))
+        return header + keysym + str(payload["char"]).encode("utf-8")
 
-def encrypt_json(fernet: Fernet, payload: dict[str, Any]) -> bytes:
-    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
-    return fernet.encrypt(data)
+    data = _json_dumps(payload)
+    if len(data) > _ZLIB_MIN_SIZE:
+        return bytes([_PAYLOAD_ZLIB_JSON]) + zlib.compress(data, 1)
+    return data
 
 
-def decrypt_json(fernet: Fernet, token: bytes) -> dict[str, Any]:
-    """Decrypt ciphertext and parse JSON; raises DecryptionError on failure."""
+def decode_payload(data: bytes) -> dict[str, Any]:
+    """Inverse of encode_payload; also accepts bare JSON from older rows."""
+    if data[:1] == bytes([_PAYLOAD_STRUCT]):
+        _, kind, keycode, keysym_len = _PAYLOAD_HEADER.unpack_from(data)
+        start = _PAYLOAD_HEADER.size
+        return {
+            "char": data[start + keysym_len :].decode("utf-8"),
+            "keysym": data[start : start + keysym_len].decode("utf-8"),
+            "keycode": keycode,
+            "widget": _WIDGETS_BY_KIND.get(kind, ""),
+        }
+    if data[:1] == bytes([_PAYLOAD_ZLIB_JSON]):
+        data = zlib.decompress(data[1:])
+    return _json_loads(data)
+
+
+def payload_encryptor(cipher: PayloadCipher) -> Callable[[dict[str, Any]], bytes]:
+    """Return an encrypt(payload) function for one cipher, with its hot calls bound up front."""
+    encode = encode_payload
+    if isinstance(cipher, AESGCM):
+        aead_encrypt = cipher.encrypt
+        urandom = os.urandom
+
+        def encrypt(payload: dict[str, Any]) -> bytes:
+            nonce = urandom(NONCE_SIZE)
+            return nonce + aead_encrypt(nonce, encode(payload), None)
+
+        return encrypt
+
+    # MiniFernet already holds its HMAC prototype and AES key schedule.
+    fernet_encrypt = cipher.encrypt
+
+    def encrypt(payload: dict[str, Any]) -> bytes:
+        return fernet_encrypt(encode(payload))
+
+    return encrypt
+
+
+def decrypt_payload(cipher: PayloadCipher, token: bytes) -> dict[str, Any]:
+    """Decrypt ciphertext and decode the payload; raises DecryptionError on failure."""
     try:
-        data = fernet.decrypt(token)
-    except InvalidToken as e:
+        if isinstance(cipher, AESGCM):
+            data = cipher.decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], None)
+        else:
+            data = cipher.decrypt(token)
+    except (InvalidTag, ValueError) as e:
         raise DecryptionError("Wrong passphrase or corrupted data.") from e
-    return json.loads(data.decode("utf-8"))
+    return decode_payload(data)
+
 
+def decrypt_many(cipher: PayloadCipher, tokens: Sequence[bytes]) -> list[dict[str, Any]]:
+    """Decrypt and decode a batch of payloads with one cipher; raises DecryptionError."""
+    if isinstance(cipher, AESGCM):
+        plaintexts = []
+        try:
+            for token in tokens:
+                plaintexts.append(cipher.decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], None))
+        except (InvalidTag, ValueError) as e:
+            raise DecryptionError("Wrong passphrase or corrupted data.") from e
+    else:
+        plaintexts = cipher.decrypt_many(tokens)
+    return [decode_payload(data) for data in plaintexts]
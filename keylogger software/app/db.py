@@ -5,156 +5,319 @@ from __future__ import annotations
 import datetime as dt
 import os
 import sqlite3
-from dataclasses import dataclass
-from typing import Iterable, Optional
+import threading
+from typing import Generator, Optional, Sequence
 
-from .constants import DEFAULT_KDF_ITERS
-from .crypto import CryptoParams
+from .constants import (
+    DEFAULT_ARGON2_ITERS,
+    DEFAULT_KDF_ID,
+    DEFAULT_KDF_ITERS,
+    FETCH_LIMIT,
+    FETCH_PAGE_SIZE,
+)
+from .crypto import (
+    CURRENT_SCHEMA_VERSION,
+    KDF_ARGON2ID,
+    KDF_PBKDF2_SHA256,
+    KDF_PBKDF2_SHA512,
+    SCHEMA_FERNET,
+    CryptoParams,
+    argon2_supported,
+)
 
 META_ID = 1
 
+# (ts_ns, event_type, keysym, keycode, ciphertext) as accepted by Database.insert_logs.
+LogTuple = tuple[int, str, str, int, bytes]
+
+_LOGS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        ts_ns INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        keysym_id INTEGER NOT NULL REFERENCES keysyms (id),
+        keycode INTEGER NOT NULL,
+        ciphertext BLOB NOT NULL
+    )
+"""
+
 
 def _connect(db_path: str) -> sqlite3.Connection:
-    """Open a connection with row_factory set to sqlite3.Row."""
-    conn = sqlite3.connect(db_path)
+    """Open a shareable autocommit connection with sqlite3.Row rows and write-friendly pragmas."""
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=134217728")
     return conn
 
 
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
 def _ensure_schema(conn: sqlite3.Connection) -> None:
-    """Create meta and logs tables if they do not exist."""
+    """Create meta and logs tables if they do not exist and migrate older layouts."""
     cur = conn.cursor()
     cur.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS meta (
             id INTEGER PRIMARY KEY CHECK (id = 1),
             salt BLOB NOT NULL,
             kdf_iters INTEGER NOT NULL,
+            kdf_id TEXT NOT NULL DEFAULT '{KDF_PBKDF2_SHA256}',
+            schema_version INTEGER NOT NULL DEFAULT {SCHEMA_FERNET},
             created_at TEXT NOT NULL
         )
         """
     )
+    meta_columns = _columns(conn, "meta")
+    if "kdf_id" not in meta_columns:
+        cur.execute(
+            f"ALTER TABLE meta ADD COLUMN kdf_id TEXT NOT NULL DEFAULT '{KDF_PBKDF2_SHA256}'"
+        )
+    if "schema_version" not in meta_columns:
+        cur.execute(
+            "ALTER TABLE meta ADD COLUMN schema_version INTEGER NOT NULL "
+            f"DEFAULT {SCHEMA_FERNET}"
+        )
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT NOT NULL,
-            event_type TEXT NOT NULL,
-            keysym TEXT NOT NULL,
-            keycode INTEGER NOT NULL,
-            ciphertext BLOB NOT NULL
+        CREATE TABLE IF NOT EXISTS keysyms (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
         )
         """
     )
+    cur.execute(_LOGS_TABLE_SQL.format(name="logs"))
+    logs_columns = _columns(conn, "logs")
+    if "ts_ns" not in logs_columns or "keysym_id" not in logs_columns:
+        _migrate_logs(conn, logs_columns)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts_desc ON logs (ts_ns DESC, id DESC)")
     conn.commit()
 
 
-def get_or_create_crypto_params(db_path: str) -> CryptoParams:
-    """Return existing crypto params for the DB, or create and store new ones."""
-    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
-    conn = _connect(db_path)
+def _migrate_logs(conn: sqlite3.Connection, columns: set[str]) -> None:
+    """Rebuild an older logs table into the current layout.
+
+    ISO-8601 TEXT timestamps become epoch-nanosecond integers and keysym strings are
+    interned into the keysyms table.
+    """
+    if "ts_ns" in columns:
+        ts_expr = "l.ts_ns"
+    else:
+        ts_expr = "COALESCE(CAST(strftime('%s', l.ts) AS INTEGER), 0) * 1000000000"
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
     try:
-        _ensure_schema(conn)
-        cur = conn.cursor()
-        cur.execute("SELECT salt, kdf_iters FROM meta WHERE id = ?", (META_ID,))
-        row = cur.fetchone()
-        if row is not None:
-            return CryptoParams(salt=row["salt"], kdf_iters=row["kdf_iters"])
-
-        salt = os.urandom(16)
-        kdf_iters = DEFAULT_KDF_ITERS
-        now = dt.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        cur.execute(_LOGS_TABLE_SQL.format(name="logs_new"))
+        cur.execute("INSERT OR IGNORE INTO keysyms (name) SELECT DISTINCT keysym FROM logs")
         cur.execute(
-            "INSERT INTO meta (id, salt, kdf_iters, created_at) VALUES (?, ?, ?, ?)",
-            (META_ID, salt, kdf_iters, now),
+            f"""
+            INSERT INTO logs_new (id, ts_ns, event_type, keysym_id, keycode, ciphertext)
+            SELECT l.id, {ts_expr}, l.event_type, k.id, l.keycode, l.ciphertext
+            FROM logs AS l JOIN keysyms AS k ON k.name = l.keysym
+            """
         )
-        conn.commit()
-        return CryptoParams(salt=salt, kdf_iters=kdf_iters)
-    finally:
-        conn.close()
+        cur.execute("DROP TABLE logs")
+        cur.execute("ALTER TABLE logs_new RENAME TO logs")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
 
 
-def get_existing_crypto_params(db_path: str) -> Optional[CryptoParams]:
-    """Return crypto params if the DB exists and has meta; otherwise None."""
-    if not os.path.exists(db_path):
+def _read_crypto_params(cur: sqlite3.Cursor) -> Optional[CryptoParams]:
+    cur.execute(
+        "SELECT salt, kdf_iters, kdf_id, schema_version FROM meta WHERE id = ?", (META_ID,)
+    )
+    row = cur.fetchone()
+    if row is None:
         return None
-    conn = _connect(db_path)
-    try:
-        _ensure_schema(conn)
-        cur = conn.cursor()
-        cur.execute("SELECT salt, kdf_iters FROM meta WHERE id = ?", (META_ID,))
-        row = cur.fetchone()
-        if row is None:
-            return None
-        return CryptoParams(salt=row["salt"], kdf_iters=row["kdf_iters"])
-    finally:
-        conn.close()
-
-
-@dataclass
-class LogRow:
-    """One row from the logs table (decrypted payload is separate)."""
-
-    id: int
-    ts: str
-    event_type: str
-    keysym: str
-    keycode: int
-    ciphertext: bytes
-
-
-def insert_log(
-    db_path: str,
-    *,
-    ts: str,
-    event_type: str,
-    keysym: str,
-    keycode: int,
-    ciphertext: bytes,
-) -> None:
-    """Append one encrypted log entry to the logs table."""
-    conn = _connect(db_path)
-    try:
-        _ensure_schema(conn)
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO logs (ts, event_type, keysym, keycode, ciphertext)
+    return CryptoParams(
+        salt=row["salt"],
+        kdf_iters=row["kdf_iters"],
+        kdf_id=row["kdf_id"],
+        schema_version=row["schema_version"],
+    )
+
+
+LOG_COLUMNS = ("id", "ts_ns", "event_type", "keysym", "keycode", "ciphertext")
+
+
+class Database:
+    """One open connection to a log DB, with the schema checked once and SQL prepared up front.
+
+    The connection is shared across threads; writes are serialized by an instance lock and
+    run inside explicit transactions since the connection is in autocommit mode.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._conn = _connect(db_path)
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            _ensure_schema(self._conn)
+
+        self._keysym_ids: dict[str, int] = {}
+
+        self._insert_sql = """
+            INSERT INTO logs (ts_ns, event_type, keysym_id, keycode, ciphertext)
             VALUES (?, ?, ?, ?, ?)
-            """,
-            (ts, event_type, keysym, keycode, ciphertext),
+        """
+        self._insert_keysym_sql = "INSERT OR IGNORE INTO keysyms (name) VALUES (?)"
+        self._select_keysym_sql = "SELECT id FROM keysyms WHERE name = ?"
+        select = """
+            SELECT logs.id, logs.ts_ns, logs.event_type, keysyms.name AS keysym,
+                   logs.keycode, logs.ciphertext
+            FROM logs JOIN keysyms ON keysyms.id = logs.keysym_id
+        """
+        order = " ORDER BY logs.ts_ns DESC, logs.id DESC LIMIT ?"
+        self._select_sql = select + order
+        self._select_before_sql = select + " WHERE (logs.ts_ns, logs.id) < (?, ?)" + order
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._conn.close()
+
+    def _keysym_id(self, name: str) -> int:
+        """Return the interned id for a keysym name; call with the write lock held."""
+        keysym_id = self._keysym_ids.get(name)
+        if keysym_id is None:
+            self._conn.execute(self._insert_keysym_sql, (name,))
+            keysym_id = self._conn.execute(self._select_keysym_sql, (name,)).fetchone()["id"]
+            self._keysym_ids[name] = keysym_id
+        return keysym_id
+
+    def get_crypto_params(self) -> Optional[CryptoParams]:
+        """Return the stored crypto params, or None if meta is empty."""
+        return _read_crypto_params(self._conn.cursor())
+
+    def get_or_create_crypto_params(self) -> CryptoParams:
+        """Return existing crypto params for the DB, or create and store new ones."""
+        with self._write_lock:
+            cur = self._conn.cursor()
+            params = _read_crypto_params(cur)
+            if params is not None:
+                return params
+
+            salt = os.urandom(16)
+            kdf_id = DEFAULT_KDF_ID
+            if kdf_id == KDF_ARGON2ID and not argon2_supported():
+                kdf_id = KDF_PBKDF2_SHA512
+            kdf_iters = DEFAULT_ARGON2_ITERS if kdf_id == KDF_ARGON2ID else DEFAULT_KDF_ITERS
+            now = dt.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+            cur.execute(
+                """
+                INSERT INTO meta (id, salt, kdf_iters, kdf_id, schema_version, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (META_ID, salt, kdf_iters, kdf_id, CURRENT_SCHEMA_VERSION, now),
+            )
+        return CryptoParams(
+            salt=salt,
+            kdf_iters=kdf_iters,
+            kdf_id=kdf_id,
+            schema_version=CURRENT_SCHEMA_VERSION,
         )
-        conn.commit()
-    finally:
-        conn.close()
 
+    def insert_log(
+        self,
+        *,
+        ts_ns: int,
+        event_type: str,
+        keysym: str,
+        keycode: int,
+        ciphertext: bytes,
+    ) -> None:
+        """Append one encrypted log entry to the logs table."""
+        with self._write_lock:
+            self._conn.execute(
+                self._insert_sql,
+                (ts_ns, event_type, self._keysym_id(keysym), keycode, ciphertext),
+            )
+
+    def insert_logs(self, rows: Sequence[LogTuple]) -> None:
+        """Append a batch of (ts_ns, event_type, keysym, keycode, ciphertext) rows in one transaction."""
+        if not rows:
+            return
+        with self._write_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany(
+                    self._insert_sql,
+                    [
+                        (ts_ns, event_type, self._keysym_id(keysym), keycode, ciphertext)
+                        for ts_ns, event_type, keysym, keycode, ciphertext in rows
+                    ],
+                )
+                cur.execute("COMMIT")
+            except sqlite3.Error:
+                cur.execute("ROLLBACK")
+                self._keysym_ids.clear()  # ids interned in this transaction were rolled back
+                raise
+
+    def fetch_log_columns(
+        self,
+        limit: Optional[int] = FETCH_LIMIT,
+        page_size: int = FETCH_PAGE_SIZE,
+        before: Optional[tuple[int, int]] = None,
+    ) -> Generator[dict[str, list], None, None]:
+        """Yield pages of up to page_size rows, newest first, as {column name: values}.
+
+        At most limit rows are returned; pass None to read the whole table. To continue a
+        capped read, pass the (ts_ns, id) of the last row seen as before.
+        """
+        limit = -1 if limit is None else limit  # a negative LIMIT means no limit in SQLite
+        cur = self._conn.cursor()
+        try:
+            if before is None:
+                cur.execute(self._select_sql, (limit,))
+            else:
+                cur.execute(self._select_before_sql, (*before, limit))
+            while True:
+                page = cur.fetchmany(page_size)
+                if not page:
+                    break
+                yield {name: list(values) for name, values in zip(LOG_COLUMNS, zip(*page))}
+        finally:
+            cur.close()
+
+
+_databases: dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: str) -> Database:
+    """Return the shared Database for db_path, opening it on first use."""
+    key = os.path.abspath(db_path)
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            database = _databases[key] = Database(db_path)
+        return database
 
-def fetch_logs(db_path: str, limit: Optional[int] = None) -> Iterable[LogRow]:
-    """Yield log rows from the DB, newest first; optional limit."""
+
+def close_databases() -> None:
+    """Close every pooled connection."""
+    with _databases_lock:
+        while _databases:
+            _databases.popitem()[1].close()
+
+
+def get_existing_crypto_params(db_path: str) -> Optional[CryptoParams]:
+    """Return crypto params if the DB exists and has meta; otherwise None."""
     if not os.path.exists(db_path):
-        return []
-    conn = _connect(db_path)
-    try:
-        _ensure_schema(conn)
-        cur = conn.cursor()
-        sql = "SELECT id, ts, event_type, keysym, keycode, ciphertext FROM logs ORDER BY ts DESC"
-        params: tuple[object, ...] = ()
-        if limit is not None:
-            sql += " LIMIT ?"
-            params = (limit,)
-        cur.execute(sql, params)
-        rows = [
-            LogRow(
-                id=row["id"],
-                ts=row["ts"],
-                event_type=row["event_type"],
-                keysym=row["keysym"],
-                keycode=row["keycode"],
-                ciphertext=row["ciphertext"],
-            )
-            for row in cur.fetchall()
-        ]
-        return rows
-    finally:
-        conn.close()
+        return None
+    return get_database(db_path).get_crypto_params()
 
+
+def bulk_import_logs(
+    db_path: str,
+    rows: Sequence[LogTuple],
+) -> None:
+    """Import many already-encrypted log rows into the DB in one transaction."""
+    get_database(db_path).insert_logs(rows)
@@ -2,13 +2,29 @@
 
 from __future__ import annotations
 
-import datetime as dt
+import queue
+import time
 import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from tkinter import filedialog, messagebox, ttk
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from . import crypto, db
-from .constants import APP_TITLE, DB_FILE_TYPES, DEFAULT_DB_FILENAME, WINDOW_GEOMETRY
+from .constants import (
+    APP_TITLE,
+    DB_FILE_TYPES,
+    DEFAULT_DB_FILENAME,
+    DERIVE_POLL_MS,
+    FETCH_LIMIT,
+    FLUSH_INTERVAL_MS,
+    FLUSH_MAX_PENDING,
+    LOAD_POLL_MS,
+    REPEAT_WINDOW_MS,
+    VIEWER_BATCH_SIZE,
+    WINDOW_GEOMETRY,
+    WORKER_THREADS,
+)
 
 
 def _ask_db_path(save: bool, initial: str) -> Optional[str]:
@@ -40,6 +56,26 @@ def _get_db_and_passphrase(
     return (db_path, passphrase)
 
 
+def _format_ts(ts_ns: int) -> str:
+    """Format an epoch-nanosecond timestamp as UTC ISO-8601 to the second."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts_ns // 1_000_000_000))
+
+
+_REPEAT_WINDOW_NS = REPEAT_WINDOW_MS * 1_000_000
+
+
+@dataclass
+class _HeldKey:
+    """The latest key press, held back so auto-repeats of it collapse into one entry."""
+
+    ts_ns: int
+    last_ns: int
+    char: str
+    keysym: str
+    keycode: int
+    count: int = 1
+
+
 class LoggerTab(ttk.Frame):
     """Tab that captures keystrokes in its text area and writes encrypted logs to the DB."""
 
@@ -49,13 +85,19 @@ class LoggerTab(ttk.Frame):
         *,
         db_path_var: tk.StringVar,
         passphrase_var: tk.StringVar,
+        executor: ThreadPoolExecutor,
     ) -> None:
         super().__init__(master)
 
         self.db_path_var = db_path_var
         self.passphrase_var = passphrase_var
+        self.executor = executor
         self.logging_enabled = True
-        self._crypto_params: Optional[crypto.CryptoParams] = None
+        self._encrypt: Optional[Callable[[Dict[str, Any]], bytes]] = None
+        self._db: Optional[db.Database] = None
+        self._pending: List[db.LogTuple] = []
+        self._flush_scheduled = False
+        self._held: Optional[_HeldKey] = None
 
         self._build_ui()
 
@@ -116,14 +158,33 @@ class LoggerTab(ttk.Frame):
             return
         db_path, passphrase = result
 
-        params = db.get_or_create_crypto_params(db_path)
-        self._crypto_params = params
+        params = db.get_database(db_path).get_or_create_crypto_params()
 
+        # Key derivation is deliberately slow; keep it off the Tk thread.
+        self.toggle_btn.configure(state="disabled")
+        self.status_var.set("Deriving key…")
+        future = self.executor.submit(crypto.build_cipher, passphrase, params)
+        self.after(DERIVE_POLL_MS, self._check_cipher_future, future, db_path)
+
+    def _check_cipher_future(self, future: Future, db_path: str) -> None:
+        if not future.done():
+            self.after(DERIVE_POLL_MS, self._check_cipher_future, future, db_path)
+            return
+        self.toggle_btn.configure(state="normal")
         try:
-            crypto.build_fernet(passphrase, params.salt, params.kdf_iters)
+            cipher = future.result()
         except crypto.CryptoError as exc:
+            self.status_var.set("Logging is OFF")
             messagebox.showerror("Crypto error", str(exc))
             return
+        except Exception as exc:
+            self.status_var.set("Logging is OFF")
+            messagebox.showerror("Key derivation failed", str(exc))
+            return
+
+        self._end_session()
+        self._encrypt = crypto.payload_encryptor(cipher)
+        self._db = db.get_database(db_path)
 
         self.logging_enabled = True
         self.toggle_btn.configure(text="Stop logging")
@@ -131,9 +192,54 @@ class LoggerTab(ttk.Frame):
 
     def _stop_logging(self) -> None:
         self.logging_enabled = False
+        self._end_session()
+        self._encrypt = None
         self.toggle_btn.configure(text="Start logging")
         self.status_var.set("Logging is OFF")
 
+    def _end_session(self) -> None:
+        """Flush any buffered entries and release the session's database."""
+        self._flush_pending(force=True)
+        self._db = None
+
+    def destroy(self) -> None:
+        self._end_session()
+        super().destroy()
+
+    def _flush_pending(self, force: bool = False) -> None:
+        """Write buffered entries to the DB in a single transaction.
+
+        A held key is only written once its repeat window has passed, unless force is set.
+        """
+        self._flush_scheduled = False
+        held = self._held
+        if held is not None and (force or time.time_ns() - held.last_ns >= _REPEAT_WINDOW_NS):
+            self._emit_held()
+
+        if self._pending and self._db is not None:
+            rows, self._pending = self._pending, []
+            self._db.insert_logs(rows)
+
+        if self._held is not None:
+            self._flush_scheduled = True
+            self.after(FLUSH_INTERVAL_MS, self._flush_pending)
+
+    def _emit_held(self) -> None:
+        """Encrypt the held key press (with its repeat count) into the pending batch."""
+        held, self._held = self._held, None
+        if held is None or self._encrypt is None:
+            return
+        payload: Dict[str, Any] = {
+            "char": held.char,
+            "keysym": held.keysym,
+            "keycode": held.keycode,
+            "widget": "logger_text",
+        }
+        if held.count > 1:
+            payload["repeat"] = held.count
+        ciphertext = self._encrypt(payload)
+        self._pending.append((held.ts_ns, "key", held.keysym, held.keycode or 0, ciphertext))
+
     def _clear_text(self) -> None:
         self.text.delete("1.0", "end")
 
@@ -142,37 +248,33 @@ class LoggerTab(ttk.Frame):
             return
         if event.widget is not self.text:
             return
-        if self._crypto_params is None:
-            return
-
-        db_path = self.db_path_var.get().strip()
-        if not db_path:
-            return
-
-        passphrase = self.passphrase_var.get()
-        if not passphrase:
+        if self._encrypt is None or self._db is None:
             return
 
-        params = self._crypto_params
-        fernet = crypto.build_fernet(passphrase, params.salt, params.kdf_iters)
-
-        payload = {
-            "char": event.char,
-            "keysym": event.keysym,
-            "keycode": event.keycode,
-            "widget": "logger_text",
-        }
-        ciphertext = crypto.encrypt_json(fernet, payload)
-
-        ts = dt.datetime.utcnow().isoformat(timespec="seconds") + "Z"
-        db.insert_log(
-            db_path,
-            ts=ts,
-            event_type="key",
-            keysym=event.keysym,
-            keycode=event.keycode or 0,
-            ciphertext=ciphertext,
-        )
+        now = time.time_ns()
+        held = self._held
+        if (
+            held is not None
+            and held.keysym == event.keysym
+            and now - held.last_ns < _REPEAT_WINDOW_NS
+        ):
+            held.count += 1
+            held.last_ns = now
+        else:
+            self._emit_held()
+            self._held = _HeldKey(
+                ts_ns=now,
+                last_ns=now,
+                char=event.char,
+                keysym=event.keysym,
+                keycode=event.keycode,
+            )
+
+        if len(self._pending) >= FLUSH_MAX_PENDING:
+            self._flush_pending()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.after(FLUSH_INTERVAL_MS, self._flush_pending)
 
 
 class ViewerTab(ttk.Frame):
@@ -184,11 +286,25 @@ class ViewerTab(ttk.Frame):
         *,
         db_path_var: tk.StringVar,
         passphrase_var: tk.StringVar,
+        executor: ThreadPoolExecutor,
     ) -> None:
         super().__init__(master)
         self.db_path_var = db_path_var
         self.passphrase_var = passphrase_var
-        self._rows_by_iid: Dict[str, db.LogRow] = {}
+        self.executor = executor
+        self._ciphertext_by_iid: Dict[str, bytes] = {}
+        self._cipher: Optional[crypto.PayloadCipher] = None
+        self._cipher_stale = False
+        self._queue: "queue.Queue[tuple[int, str, Any]]" = queue.Queue()
+        self._load_gen = 0
+        self._drain_id: Optional[str] = None
+        self._loaded = 0
+        self._db_path = ""
+        self._params: Optional[crypto.CryptoParams] = None
+        self._oldest_key: Optional[tuple[int, int]] = None
+
+        self.db_path_var.trace_add("write", self._invalidate_cipher)
+        self.passphrase_var.trace_add("write", self._invalidate_cipher)
 
         self._build_ui()
 
@@ -210,10 +326,14 @@ class ViewerTab(ttk.Frame):
         ttk.Button(top, text="Load logs", command=self._load_logs).grid(
             row=1, column=2, sticky="w", pady=(6, 0)
         )
+        self.more_btn = ttk.Button(
+            top, text="Load more", command=self._load_more, state="disabled"
+        )
+        self.more_btn.grid(row=1, column=3, sticky="w", padx=(4, 0), pady=(6, 0))
 
         self.status_var = tk.StringVar(value="No logs loaded.")
         ttk.Label(top, textvariable=self.status_var).grid(
-            row=2, column=0, columnspan=3, sticky="w", pady=(6, 0)
+            row=2, column=0, columnspan=4, sticky="w", pady=(6, 0)
         )
 
         top.columnconfigure(1, weight=1)
@@ -250,70 +370,179 @@ class ViewerTab(ttk.Frame):
         if path:
             self.db_path_var.set(path)
 
+    def _invalidate_cipher(self, *_args: object) -> None:
+        """Drop the cached cipher once the DB path or passphrase no longer match the load."""
+        self._cipher = None
+        self._cipher_stale = True
+        self.more_btn.configure(state="disabled")
+
     def _load_logs(self) -> None:
         result = _get_db_and_passphrase(self.db_path_var, self.passphrase_var)
         if result is None:
             return
         db_path, passphrase = result
 
+        self._cancel_load()
+        self.tree.delete(*self.tree.get_children())
+        self._ciphertext_by_iid.clear()
+
         params = db.get_existing_crypto_params(db_path)
         if params is None:
             self.status_var.set("No metadata found; no logs yet?")
-            self.tree.delete(*self.tree.get_children())
             return
 
-        try:
-            fernet = crypto.build_fernet(passphrase, params.salt, params.kdf_iters)
-        except crypto.CryptoError as exc:
-            messagebox.showerror("Crypto error", str(exc))
+        self._cipher = None  # salt may differ if the DB file was replaced
+        self._cipher_stale = False
+        self._loaded = 0
+        self._db_path = db_path
+        self._params = params
+        self._oldest_key = None
+        self.more_btn.configure(state="disabled")
+        self.status_var.set("Loading log entries…")
+        self.executor.submit(self._load_worker, self._load_gen, db_path, passphrase, params)
+        self._drain_id = self.after(LOAD_POLL_MS, self._drain_queue)
+
+    def _load_more(self) -> None:
+        """Append the next FETCH_LIMIT older entries, reusing the cipher from the last load."""
+        if self._cipher is None or self._params is None or self._oldest_key is None:
             return
 
-        rows = list(db.fetch_logs(db_path))
-        self.tree.delete(*self.tree.get_children())
-        self._rows_by_iid.clear()
+        self._cancel_load()
+        self.more_btn.configure(state="disabled")
+        self.status_var.set(f"Loading log entries… {self._loaded}")
+        self.executor.submit(
+            self._load_worker,
+            self._load_gen,
+            self._db_path,
+            self.passphrase_var.get(),
+            self._params,
+            self._oldest_key,
+            self._cipher,
+        )
+        self._drain_id = self.after(LOAD_POLL_MS, self._drain_queue)
 
-        if not rows:
-            self.status_var.set("No log entries found.")
-            return
+    def _cancel_load(self) -> None:
+        """Stop any in-flight load; the worker notices the generation change."""
+        self._load_gen += 1
+        if self._drain_id is not None:
+            self.after_cancel(self._drain_id)
+            self._drain_id = None
 
+    def destroy(self) -> None:
+        self._cancel_load()
+        super().destroy()
+
+    def _load_worker(
+        self,
+        gen: int,
+        db_path: str,
+        passphrase: str,
+        params: crypto.CryptoParams,
+        before: Optional[tuple[int, int]] = None,
+        cipher: Optional[crypto.PayloadCipher] = None,
+    ) -> None:
+        """Derive the key and decrypt rows in batches off the Tk thread, posting to the queue.
+
+        Reads up to FETCH_LIMIT rows older than before; "done" carries whether the cap was hit.
+        """
+        pages = None
+        fetched = 0
         try:
-            for row in rows:
-                payload = crypto.decrypt_json(fernet, row.ciphertext)
-                preview = payload.get("char") or payload.get("keysym") or ""
-                iid = self.tree.insert(
-                    "",
-                    "end",
-                    values=(row.ts, row.event_type, row.keysym, preview),
-                )
-                self._rows_by_iid[iid] = row
+            if cipher is None:
+                cipher = crypto.build_cipher(passphrase, params)
+                self._queue.put((gen, "cipher", cipher))
+
+            pages = db.get_database(db_path).fetch_log_columns(
+                limit=FETCH_LIMIT, page_size=VIEWER_BATCH_SIZE, before=before
+            )
+            for columns in pages:
+                if gen != self._load_gen:
+                    break
+                payloads = crypto.decrypt_many(cipher, columns["ciphertext"])
+                fetched += len(payloads)
+                self._queue.put((gen, "rows", (columns, payloads)))
         except crypto.DecryptionError as exc:
-            self.tree.delete(*self.tree.get_children())
-            self._rows_by_iid.clear()
-            self.status_var.set("Failed to decrypt logs.")
-            messagebox.showerror("Decryption error", str(exc))
-            return
-
-        self.status_var.set(f"Loaded {len(rows)} log entries.")
+            self._queue.put((gen, "error", ("Decryption error", str(exc))))
+        except crypto.CryptoError as exc:
+            self._queue.put((gen, "error", ("Crypto error", str(exc))))
+        except Exception as exc:
+            # The executor would otherwise keep this in the Future and the drain would poll forever.
+            self._queue.put((gen, "error", ("Load error", str(exc))))
+        else:
+            self._queue.put((gen, "done", fetched >= FETCH_LIMIT))
+        finally:
+            if pages is not None:
+                pages.close()
+
+    def _drain_queue(self) -> None:
+        """Apply worker results on the Tk thread, one batch of rows per tick."""
+        self._drain_id = None
+        while True:
+            try:
+                gen, kind, data = self._queue.get_nowait()
+            except queue.Empty:
+                self._drain_id = self.after(LOAD_POLL_MS, self._drain_queue)
+                return
+            if gen != self._load_gen:
+                continue
+
+            if kind == "cipher":
+                if not self._cipher_stale:
+                    self._cipher = data
+            elif kind == "rows":
+                columns, payloads = data
+                for ts_ns, event_type, keysym, ciphertext, payload in zip(
+                    columns["ts_ns"],
+                    columns["event_type"],
+                    columns["keysym"],
+                    columns["ciphertext"],
+                    payloads,
+                ):
+                    preview = payload.get("char") or payload.get("keysym") or ""
+                    iid = self.tree.insert(
+                        "", "end", values=(_format_ts(ts_ns), event_type, keysym, preview)
+                    )
+                    self._ciphertext_by_iid[iid] = ciphertext
+                self._loaded += len(payloads)
+                self._oldest_key = (columns["ts_ns"][-1], columns["id"][-1])
+                self.status_var.set(f"Loading log entries… {self._loaded}")
+                self._drain_id = self.after_idle(self._drain_queue)
+                return
+            elif kind == "error":
+                title, message = data
+                self.tree.delete(*self.tree.get_children())
+                self._ciphertext_by_iid.clear()
+                self.status_var.set(
+                    "Failed to decrypt logs." if title == "Decryption error" else "No logs loaded."
+                )
+                messagebox.showerror(title, message)
+                return
+            else:
+                if self._loaded == 0:
+                    self.status_var.set("No log entries found.")
+                elif data:
+                    self.status_var.set(
+                        f"Showing the newest {self._loaded:,} log entries; "
+                        "use Load more for older ones."
+                    )
+                    if not self._cipher_stale:
+                        self.more_btn.configure(state="normal")
+                else:
+                    self.status_var.set(f"Loaded {self._loaded} log entries.")
+                return
 
     def _on_select(self, event: tk.Event) -> None:  # type: ignore[override]
         selection = self.tree.selection()
         if not selection:
             return
         iid = selection[0]
-        row = self._rows_by_iid.get(iid)
-        if row is None:
-            return
-
-        db_path = self.db_path_var.get().strip()
-        passphrase = self.passphrase_var.get()
-        params = db.get_existing_crypto_params(db_path)
-        if not db_path or not passphrase or params is None:
+        ciphertext = self._ciphertext_by_iid.get(iid)
+        if ciphertext is None or self._cipher is None:
             return
 
         try:
-            fernet = crypto.build_fernet(passphrase, params.salt, params.kdf_iters)
-            payload = crypto.decrypt_json(fernet, row.ciphertext)
-        except (crypto.CryptoError, crypto.DecryptionError):
+            payload = crypto.decrypt_payload(self._cipher, ciphertext)
+        except crypto.DecryptionError:
             return
 
         self.detail_text.configure(state="normal")
@@ -333,6 +562,8 @@ class App(ttk.Frame):
         self.db_path_var = tk.StringVar(value=DEFAULT_DB_FILENAME)
         self.passphrase_var = tk.StringVar()
 
+        self.executor = ThreadPoolExecutor(max_workers=WORKER_THREADS)
+
         notebook = ttk.Notebook(self)
         notebook.pack(fill="both", expand=True)
 
@@ -340,15 +571,22 @@ class App(ttk.Frame):
             notebook,
             db_path_var=self.db_path_var,
             passphrase_var=self.passphrase_var,
+            executor=self.executor,
         )
         viewer_tab = ViewerTab(
             notebook,
             db_path_var=self.db_path_var,
             passphrase_var=self.passphrase_var,
+            executor=self.executor,
         )
         notebook.add(logger_tab, text="Logger")
         notebook.add(viewer_tab, text="Viewer")
 
+    def destroy(self) -> None:
+        super().destroy()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        db.close_databases()
+
 
 def main() -> None:
     """Create the main window and run the event loop."""